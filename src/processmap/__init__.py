@@ -1,5 +1,7 @@
 __version__ = "0.1.0"
 __lib_name__ = "processmap"
 
+from .builder import *  # noqa
 from .graph import *  # noqa
 from .process import *  # noqa
+from .scheduling import *  # noqa
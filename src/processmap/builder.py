@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from collections.abc import Hashable, Iterable, Sequence
+
+from .graph import CompactGraph, Graph
+
+__all__ = ["GraphBuilder"]
+
+
+class GraphBuilder:
+    """
+    Builds large graphs from columns of node ids, e.g. from a database extract
+
+    Nodes are created on first use of their id. Processes using resources
+    request them after their start node and release them before their end node,
+    like Process(...).using(...), the nodes in between have anonymous ids.
+    """
+
+    def __init__(self) -> None:
+        self._index: dict[Hashable, int] = {}
+        self._requests: dict[int, object] = {}
+        self._releases: dict[int, object] = {}
+        self._holdings: list[tuple[int, int]] = []
+        self._process_starts: list[int] = []
+        self._process_ends: list[int] = []
+        self._names: list[str] = []
+        self._durations: list[int] = []
+        self._dependency_starts: list[int] = []
+        self._dependency_ends: list[int] = []
+
+    def _indices(self, ids: Iterable[Hashable]) -> list[int]:
+        index = self._index
+        return [index.setdefault(i, len(index)) for i in ids]
+
+    def _anonymous(self) -> int:
+        return self._indices([object()])[0]
+
+    def add_nodes(self, ids: Iterable[Hashable]) -> None:
+        """Add nodes that may not have any edges"""
+        self._indices(ids)
+
+    def add_processes(
+        self,
+        starts: Iterable[Hashable],
+        ends: Iterable[Hashable],
+        names: Iterable[str],
+        durations: Iterable[int],
+        resources: Iterable[Sequence[object]] | None = None,
+    ) -> None:
+        """Add a process edge per row, optionally using a sequence of resources"""
+        starts, ends = list(starts), list(ends)
+        names, durations = list(names), list(durations)
+        used_resources = None if resources is None else list(resources)
+        lengths = {len(starts), len(ends), len(names), len(durations)}
+        if used_resources is not None:
+            lengths.add(len(used_resources))
+        if len(lengths) > 1:
+            raise ValueError("Process columns must have equal lengths")
+        start_indices = self._indices(starts)
+        end_indices = self._indices(ends)
+        if used_resources is None:
+            self._process_starts += start_indices
+            self._process_ends += end_indices
+            self._names += names
+            self._durations += durations
+            return
+        rows = zip(start_indices, end_indices, names, durations, used_resources)
+        for start, end, name, duration, used in rows:
+            if used:
+                inner_start, inner_end = self._anonymous(), self._anonymous()
+                requests = []
+                for resource in used:
+                    self._requests[request := self._anonymous()] = resource
+                    self._dependency_starts += (start, request)
+                    self._dependency_ends += (request, inner_start)
+                    requests.append(request)
+                for resource, request in zip(reversed(used), reversed(requests)):
+                    self._releases[release := self._anonymous()] = resource
+                    self._dependency_starts += (inner_end, release)
+                    self._dependency_ends += (release, end)
+                    self._holdings.append((request, release))
+                start, end = inner_start, inner_end
+            self._process_starts.append(start)
+            self._process_ends.append(end)
+            self._names.append(name)
+            self._durations.append(duration)
+
+    def add_dependencies(
+        self, starts: Iterable[Hashable], ends: Iterable[Hashable]
+    ) -> None:
+        """Add a dependency edge per row"""
+        starts, ends = list(starts), list(ends)
+        if len(starts) != len(ends):
+            raise ValueError("Dependency columns must have equal lengths")
+        self._dependency_starts += self._indices(starts)
+        self._dependency_ends += self._indices(ends)
+
+    def compact(self) -> CompactGraph:
+        """Validate that the graph is acyclic and derive its start and end nodes"""
+        size = len(self._index)
+        in_degrees = [0] * size
+        out_degrees = [0] * size
+        successors: list[list[int]] = [[] for _ in range(size)]
+        for starts, ends in (
+            (self._process_starts, self._process_ends),
+            (self._dependency_starts, self._dependency_ends),
+        ):
+            for u, v in zip(starts, ends):
+                successors[u].append(v)
+                in_degrees[v] += 1
+                out_degrees[u] += 1
+        start = [i for i, degree in enumerate(in_degrees) if degree == 0]
+        end = [i for i, degree in enumerate(out_degrees) if degree == 0]
+        remaining = in_degrees.copy()
+        order = start.copy()
+        for u in order:  # grows while iterating
+            for v in successors[u]:
+                remaining[v] -= 1
+                if remaining[v] == 0:
+                    order.append(v)
+        if len(order) != size:
+            raise ValueError("Graph contains a cycle")
+        return CompactGraph(
+            ids=list(self._index),
+            requests=dict(self._requests),
+            releases=dict(self._releases),
+            process_starts=self._process_starts.copy(),
+            process_ends=self._process_ends.copy(),
+            names=self._names.copy(),
+            durations=self._durations.copy(),
+            dependency_starts=self._dependency_starts.copy(),
+            dependency_ends=self._dependency_ends.copy(),
+            start=start,
+            end=end,
+            holdings=self._holdings.copy(),
+        )
+
+    def build(self) -> Graph:
+        return self.compact().to_graph()
@@ -1,17 +1,19 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from collections.abc import Mapping
+from collections.abc import Callable, Hashable, Mapping, Sequence
 from dataclasses import dataclass
 
 __all__ = [
     "Graph",
+    "CompactGraph",
     "Node",
     "ProcessNode",
     "RequestNode",
     "ReleaseNode",
     "ProcessEdge",
     "DependencyEdge",
+    "ChoiceEdge",
 ]
 
 
@@ -78,7 +80,20 @@ class DependencyEdge(BaseEdge):
         return dict()
 
 
-Edge = ProcessEdge | DependencyEdge
+@dataclass(frozen=True)
+class ChoiceEdge(BaseEdge):
+    """
+    Stands in for a conditional branch between start and end
+    The branch is only compiled when chosen, choose returns None to skip it
+    """
+
+    choose: Callable[[], Graph | None]
+
+    def attributes(self) -> Mapping[str, object]:
+        return {"choose": self.choose}
+
+
+Edge = ProcessEdge | DependencyEdge | ChoiceEdge
 
 
 @dataclass(frozen=True)
@@ -89,3 +104,98 @@ class Graph:
     # TODO: reconsider if we want this duplicate info
     start: frozenset[Node]
     end: frozenset[Node]
+
+    # requests paired with the release that ends holding their resource
+    holdings: frozenset[tuple[Node, Node]] = frozenset()
+
+
+@dataclass(frozen=True, eq=False)
+class CompactGraph:
+    """
+    A graph stored as columns of node indices instead of node and edge objects
+    Nodes are identified by their ids, nodes absent from requests and releases
+    are process nodes. Requests missing from holdings are paired with a release
+    when scheduling, by walking the graph.
+    """
+
+    ids: Sequence[Hashable]
+    requests: Mapping[int, object]  # node index -> requested resource
+    releases: Mapping[int, object]  # node index -> released resource
+    process_starts: Sequence[int]
+    process_ends: Sequence[int]
+    names: Sequence[str]
+    durations: Sequence[int]
+    dependency_starts: Sequence[int]
+    dependency_ends: Sequence[int]
+    start: Sequence[int]
+    end: Sequence[int]
+    holdings: Sequence[tuple[int, int]] = ()  # (request index, release index)
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> CompactGraph:
+        """
+        Index the nodes of a graph, using the nodes themselves as ids
+        Choice edges only impose precedence, as their branches are not compiled
+        """
+        nodes = list(graph.nodes)
+        index = {node: i for i, node in enumerate(nodes)}.__getitem__
+        processes = [edge for edge in graph.edges if isinstance(edge, ProcessEdge)]
+        dependencies = [
+            edge for edge in graph.edges if not isinstance(edge, ProcessEdge)
+        ]
+        return cls(
+            ids=nodes,
+            requests={
+                i: node.requested_resource
+                for i, node in enumerate(nodes)
+                if isinstance(node, RequestNode)
+            },
+            releases={
+                i: node.released_resource
+                for i, node in enumerate(nodes)
+                if isinstance(node, ReleaseNode)
+            },
+            process_starts=[index(edge.start) for edge in processes],
+            process_ends=[index(edge.end) for edge in processes],
+            names=[edge.name for edge in processes],
+            durations=[edge.duration for edge in processes],
+            dependency_starts=[index(edge.start) for edge in dependencies],
+            dependency_ends=[index(edge.end) for edge in dependencies],
+            start=[index(node) for node in graph.start],
+            end=[index(node) for node in graph.end],
+            holdings=[(index(u), index(v)) for u, v in graph.holdings],
+        )
+
+    def to_graph(self) -> Graph:
+        requests, releases = self.requests, self.releases
+        nodes: list[Node] = [
+            RequestNode(requests[i])
+            if i in requests
+            else ReleaseNode(releases[i])
+            if i in releases
+            else ProcessNode()
+            for i in range(len(self.ids))
+        ]
+        node = nodes.__getitem__
+        return Graph(
+            nodes=frozenset(nodes),
+            edges=frozenset(
+                [
+                    *map(
+                        ProcessEdge,
+                        map(node, self.process_starts),
+                        map(node, self.process_ends),
+                        self.names,
+                        self.durations,
+                    ),
+                    *map(
+                        DependencyEdge,
+                        map(node, self.dependency_starts),
+                        map(node, self.dependency_ends),
+                    ),
+                ]
+            ),
+            start=frozenset(map(node, self.start)),
+            end=frozenset(map(node, self.end)),
+            holdings=frozenset((node(u), node(v)) for u, v in self.holdings),
+        )
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
+import io
+import pickle
 from abc import ABC, abstractmethod
 from collections.abc import Sequence, Callable
-from dataclasses import dataclass
-from functools import reduce
+from dataclasses import dataclass, replace
+from functools import cached_property, partial, reduce
 from itertools import product
+from typing import IO, Any, SupportsIndex
 
 from .common import fset
 from .graph import (
+    ChoiceEdge,
     DependencyEdge,
     Graph,
     ProcessEdge,
@@ -16,22 +20,36 @@ from .graph import (
     RequestNode,
 )
 
-__all__ = ["ProcessMap", "Process", "Seq", "Union", "Request", "Release"]
+__all__ = [
+    "ProcessMap",
+    "Process",
+    "Seq",
+    "Union",
+    "Request",
+    "Release",
+    "Option",
+    "Switch",
+    "dumps",
+    "loads",
+]
 
 
 ObjectId = int
+# compiled process maps are kept with their graphs, so their ids are not reused
+Subgraphs = dict[ObjectId, tuple["ProcessMap", Graph]]
 
 
 class ProcessMap(ABC):
-    def to_subgraph(self, subgraphs: dict[ObjectId, Graph]) -> Graph:
+    def to_subgraph(self, subgraphs: Subgraphs) -> Graph:
         try:
-            return subgraphs[id(self)]
+            return subgraphs[id(self)][1]
         except KeyError:
-            graph = subgraphs[id(self)] = self._to_subgraph(subgraphs)
+            graph = self._to_subgraph(subgraphs)
+            subgraphs[id(self)] = self, graph
             return graph
 
     @abstractmethod
-    def _to_subgraph(self, subgraphs: dict[ObjectId, Graph]) -> Graph:
+    def _to_subgraph(self, subgraphs: Subgraphs) -> Graph:
         ...
 
     def to_graph(self) -> Graph:
@@ -47,13 +65,29 @@ class ProcessMap(ABC):
     def using(self, resource: object, *additional_resources: object) -> ProcessMap:
         return WithResources(self, [resource, *additional_resources])
 
+    def __copy__(self) -> ProcessMap:
+        """Share nested process maps and caches, __reduce_ex__ would rebuild them"""
+        result = object.__new__(type(self))
+        result.__dict__.update(self.__dict__)
+        return result
+
+    def __reduce_ex__(self, protocol: SupportsIndex) -> str | tuple[Any, ...]:
+        """
+        Pickle as a flat table, long chains would otherwise exceed recursion
+        Each process map pickled this way gets its own table, use dumps to
+        share process maps between several of them
+        """
+        if type(self) not in _CODES:
+            return super().__reduce_ex__(protocol)
+        return _from_table, (_to_table(self),)
+
 
 @dataclass(frozen=True)
 class Process(ProcessMap):
     name: str
     duration: int
 
-    def _to_subgraph(self, subgraphs: dict[ObjectId, Graph]) -> Graph:
+    def _to_subgraph(self, subgraphs: Subgraphs) -> Graph:
         return Graph(
             nodes=fset(start := ProcessNode(), end := ProcessNode()),
             edges=fset(ProcessEdge(start, end, self.name, self.duration)),
@@ -72,7 +106,7 @@ class Seq(ProcessMap):
     a: ProcessMap
     b: ProcessMap
 
-    def _to_subgraph(self, subgraphs: dict[ObjectId, Graph]) -> Graph:
+    def _to_subgraph(self, subgraphs: Subgraphs) -> Graph:
         graph_a = self.a.to_subgraph(subgraphs)
         graph_b = self.b.to_subgraph(subgraphs)
         links = {DependencyEdge(u, v) for u, v in product(graph_a.end, graph_b.start)}
@@ -81,6 +115,7 @@ class Seq(ProcessMap):
             edges=graph_a.edges | graph_b.edges | links,
             start=graph_a.start,
             end=graph_b.end,
+            holdings=graph_a.holdings | graph_b.holdings,
         )
 
 
@@ -93,7 +128,7 @@ class Union(ProcessMap):
     a: ProcessMap
     b: ProcessMap
 
-    def _to_subgraph(self, subgraphs: dict[ObjectId, Graph]) -> Graph:
+    def _to_subgraph(self, subgraphs: Subgraphs) -> Graph:
         graph_a = self.a.to_subgraph(subgraphs)
         graph_b = self.b.to_subgraph(subgraphs)
         return Graph(
@@ -103,6 +138,7 @@ class Union(ProcessMap):
                 edge.end for edge in edges
             ),
             end=(graph_a.end | graph_b.end).difference(edge.start for edge in edges),
+            holdings=graph_a.holdings | graph_b.holdings,
         )
 
 
@@ -114,7 +150,7 @@ class Request(ProcessMap):
 
     resource: object
 
-    def _to_subgraph(self, subgraphs: dict[ObjectId, Graph]) -> Graph:
+    def _to_subgraph(self, subgraphs: Subgraphs) -> Graph:
         return Graph(
             nodes=fset(node := RequestNode(requested_resource=self.resource)),
             edges=fset(),
@@ -131,7 +167,7 @@ class Release(ProcessMap):
 
     resource: object
 
-    def _to_subgraph(self, subgraphs: dict[ObjectId, Graph]) -> Graph:
+    def _to_subgraph(self, subgraphs: Subgraphs) -> Graph:
         return Graph(
             nodes=fset(node := ReleaseNode(released_resource=self.resource)),
             edges=fset(),
@@ -152,13 +188,228 @@ class WithResources(ProcessMap):
     def __post_init__(self) -> None:
         assert len(self.resources) > 0
 
-    def _to_subgraph(self, subgraphs: dict[ObjectId, Graph]) -> Graph:
-        all_requests = reduce(Union.__call__, map(Request, self.resources))
-        all_releases = reduce(
-            Union.__call__,
-            map(Release, reversed(self.resources)),
+    @cached_property
+    def _expanded(self) -> tuple[list[Request], list[Release], ProcessMap]:
+        # shared by every graph compiled from self
+        requests = list(map(Request, self.resources))
+        releases = list(map(Release, self.resources))
+        all_requests = reduce(Union.__call__, requests)
+        all_releases = reduce(Union.__call__, reversed(releases))
+        return requests, releases, all_requests >> self.process >> all_releases
+
+    def _to_subgraph(self, subgraphs: Subgraphs) -> Graph:
+        requests, releases, expanded = self._expanded
+        graph = expanded.to_subgraph(subgraphs)
+        holdings = {
+            holding
+            for request, release in zip(requests, releases)
+            for holding in product(
+                request.to_subgraph(subgraphs).start,
+                release.to_subgraph(subgraphs).start,
+            )
+        }
+        return replace(graph, holdings=graph.holdings | holdings)
+
+
+def _choice(choose: Callable[[], Graph | None]) -> Graph:
+    return Graph(
+        nodes=fset(start := ProcessNode(), end := ProcessNode()),
+        edges=fset(ChoiceEdge(start, end, choose)),
+        start=fset(start),
+        end=fset(end),
+    )
+
+
+@dataclass(frozen=True)
+class Option(ProcessMap):
+    """
+    A process that can be skipped, depending on a condition evaluated at the start
+    of the wrapping process
+
+    The nested process is only compiled once it is chosen for the first time,
+    as part of the same graph, so process maps it shares with the rest of the
+    graph keep their nodes
+    """
+
+    condition: Callable[[], bool]
+    process: ProcessMap
+
+    def _to_subgraph(self, subgraphs: Subgraphs) -> Graph:
+        return _choice(partial(self._choose, subgraphs))
+
+    def _choose(self, subgraphs: Subgraphs) -> Graph | None:
+        if self.condition():
+            return self.process.to_subgraph(subgraphs)
+        return None
+
+
+@dataclass(frozen=True)
+class Switch(ProcessMap):
+    """
+    A process that wraps two process
+    Depending on a condition evaluated at the start of the wrapping process
+    only one of the two processes will be executed and the other will be skipped
+
+    Each of the processes is only compiled once it is chosen for the first time,
+    as part of the same graph, like the nested process of an Option
+
+    Should behave as:
+    Option(F, process1) | Option(lambda x: not F(), process2)
+    """
+
+    condition: Callable[[], bool]
+    process1: ProcessMap
+    process2: ProcessMap
+
+    def _to_subgraph(self, subgraphs: Subgraphs) -> Graph:
+        return _choice(partial(self._choose, subgraphs))
+
+    def _choose(self, subgraphs: Subgraphs) -> Graph:
+        process = self.process1 if self.condition() else self.process2
+        return process.to_subgraph(subgraphs)
+
+
+# Rows reference nested process maps by their index in the table, shared
+# process maps are stored once and only after all process maps they contain
+_FIELDS: dict[type[ProcessMap], tuple[tuple[str, ...], tuple[str, ...]]] = {
+    # process map fields, other fields
+    Process: ((), ("name", "duration")),
+    Seq: (("a", "b"), ()),
+    Union: (("a", "b"), ()),
+    Request: ((), ("resource",)),
+    Release: ((), ("resource",)),
+    WithResources: (("process",), ("resources",)),
+    Option: (("process",), ("condition",)),
+    Switch: (("process1", "process2"), ("condition",)),
+}
+_KINDS = list(_FIELDS)
+_CODES = {kind: code for code, kind in enumerate(_KINDS)}
+_OPAQUE = -1  # other process maps are pickled as they are
+
+Row = tuple[object, ...]  # (code, *indices, *values)
+
+
+def _to_table(root: ProcessMap) -> tuple[Row, ...]:
+    rows: list[Row] = []
+    indices: dict[ObjectId, int] = {}
+    strings: dict[str, str] = {}  # equal names are pickled once
+    stack: list[tuple[ProcessMap, bool]] = [(root, False)]
+    while stack:
+        item, expanded = stack.pop()
+        if id(item) in indices:
+            continue
+        if type(item) not in _CODES:
+            indices[id(item)] = len(rows)
+            rows.append((_OPAQUE, item))
+            continue
+        map_fields, value_fields = _FIELDS[type(item)]
+        children: list[ProcessMap] = [getattr(item, name) for name in map_fields]
+        if not expanded and any(id(child) not in indices for child in children):
+            stack.append((item, True))
+            stack.extend((child, False) for child in reversed(children))
+            continue
+        values = [getattr(item, name) for name in value_fields]
+        indices[id(item)] = len(rows)
+        rows.append(
+            (
+                _CODES[type(item)],
+                *(indices[id(child)] for child in children),
+                *(strings.setdefault(v, v) if type(v) is str else v for v in values),
+            )
+        )
+    return tuple(rows)
+
+
+def _from_table(rows: tuple[Row, ...]) -> ProcessMap:
+    items: list[ProcessMap] = []
+    for code, *fields in rows:
+        if code == _OPAQUE:
+            items.append(fields[0])  # type: ignore[arg-type]
+            continue
+        count = len(_FIELDS[_KINDS[code]][0])  # type: ignore[call-overload]
+        children = map(items.__getitem__, fields[:count])  # type: ignore[arg-type]
+        items.append(_construct(code, *children, *fields[count:]))  # type: ignore
+    return items[-1]
+
+
+def _construct(code: int, *fields: object) -> ProcessMap:
+    kind = _KINDS[code]
+    map_fields, value_fields = _FIELDS[kind]
+    return kind(
+        **dict(zip(map_fields, fields)),
+        **dict(zip(value_fields, fields[len(map_fields) :])),
+    )
+
+
+def _last(items: list[ProcessMap]) -> ProcessMap:
+    return items[-1]
+
+
+class _Pickler(pickle.Pickler):
+    """
+    Pickles process maps by their fields, after the process maps they contain,
+    so the memo shares them within the whole payload without deep recursion
+    """
+
+    def __init__(self, file: IO[bytes], protocol: int | None) -> None:
+        super().__init__(file, protocol)
+        self.pickled: set[ObjectId] = set()
+        self.strings: dict[str, str] = {}  # equal names are pickled once
+
+    def reducer_override(self, obj: object) -> Any:
+        if type(obj) not in _CODES:
+            return NotImplemented
+        assert isinstance(obj, ProcessMap)
+        pending = self._pending(obj)
+        if pending:
+            return _last, ([*pending, obj],)
+        map_fields, value_fields = _FIELDS[type(obj)]
+        strings = self.strings
+        values = [getattr(obj, name) for name in value_fields]
+        return _construct, (
+            _CODES[type(obj)],
+            *(getattr(obj, name) for name in map_fields),
+            *(strings.setdefault(v, v) if type(v) is str else v for v in values),
         )
-        return (all_requests >> self.process >> all_releases).to_subgraph(subgraphs)
+
+    def _pending(self, root: ProcessMap) -> list[ProcessMap]:
+        """
+        Process maps within root that are not pickled yet, each after the
+        process maps it contains, they are pickled right after
+        """
+        pending: list[ProcessMap] = []
+        pickled = self.pickled
+        stack: list[tuple[ProcessMap, bool]] = [(root, False)]
+        while stack:
+            item, expanded = stack.pop()
+            if id(item) in pickled:
+                continue
+            children: list[ProcessMap] = [
+                child
+                for child in (getattr(item, name) for name in _FIELDS[type(item)][0])
+                if type(child) in _CODES and id(child) not in pickled
+            ]
+            if not expanded and children:
+                stack.append((item, True))
+                stack.extend((child, False) for child in reversed(children))
+                continue
+            pickled.add(id(item))
+            pending.append(item)
+        return pending[:-1]  # without root
+
+
+def dumps(obj: object, protocol: int | None = None) -> bytes:
+    """
+    Pickle an object containing process maps, like a list of them, sharing
+    process maps between all of them, also through other process maps
+    """
+    file = io.BytesIO()
+    _Pickler(file, protocol).dump(obj)
+    return file.getvalue()
+
+
+def loads(data: bytes) -> Any:
+    return pickle.loads(data)
 
 
 # @dataclass(frozen=True)
@@ -169,29 +420,3 @@ class WithResources(ProcessMap):
 #     """
 #
 #     earliest_start_time: int
-#
-#
-# @dataclass(frozen=True)
-# class Option(ProcessMap):
-#     """
-#     A process that can be skipped, depending on a condition evaluated at the start of the wrapping process
-#     """
-#
-#     condition: Callable[[], bool]
-#     process: ProcessMap
-#
-#
-# @dataclass(frozen=True)
-# class Switch(ProcessMap):
-#     """
-#     A process that wraps two process
-#     Depending on a condition evaluated at the start of the wrapping process
-#     only one of the two processes will be executed and the other will be skipped
-#
-#     Should behave as:
-#     Option(F, process1) | Option(lambda x: not F(), process2)
-#     """
-#
-#     condition: Callable[[], bool]
-#     process1: ProcessMap
-#     process2: ProcessMap
@@ -0,0 +1,554 @@
+from __future__ import annotations
+
+import os
+from bisect import bisect_right
+from collections.abc import Callable, Hashable, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from heapq import heapify, heappop, heappush
+from itertools import chain, repeat
+
+from .graph import CompactGraph, Graph
+
+__all__ = [
+    "Schedule",
+    "ScheduleProblem",
+    "PriorityRule",
+    "schedule",
+    "latest_finish",
+    "longest_path",
+    "most_successors",
+]
+
+
+BlockId = int
+Demand = tuple[int, int, int, int]  # resource index, start offset, end offset, units
+
+
+@dataclass(frozen=True)
+class ScheduleProblem:
+    """
+    A graph condensed into blocks that are placed as a whole
+
+    Nodes between a request and its matching release, together with any
+    holding intervals overlapping them, form one block whose internal timing
+    is fixed relative to the block start. Every other node is a block by itself.
+    """
+
+    lengths: list[int]
+    successors: list[list[tuple[BlockId, int]]]  # (successor, minimal time lag)
+    demands: list[tuple[Demand, ...]]
+    capacities: list[int]
+    order: list[BlockId]  # topological
+
+
+PriorityRule = Callable[[ScheduleProblem], Sequence[int]]
+"""Returns a key per block; eligible blocks with the lowest key are placed first"""
+
+
+@dataclass(frozen=True)
+class Schedule:
+    start_times: Mapping[Hashable, int]
+    makespan: int
+    rule: PriorityRule
+
+
+def _tails(problem: ScheduleProblem) -> list[int]:
+    """Longest time from the start of each block to the end of the schedule"""
+    tails = list(problem.lengths)
+    successors = problem.successors
+    for block in reversed(problem.order):
+        for successor, lag in successors[block]:
+            tails[block] = max(tails[block], lag + tails[successor])
+    return tails
+
+
+def latest_finish(problem: ScheduleProblem) -> Sequence[int]:
+    return [length - tail for length, tail in zip(problem.lengths, _tails(problem))]
+
+
+def longest_path(problem: ScheduleProblem) -> Sequence[int]:
+    return [-tail for tail in _tails(problem)]
+
+
+def most_successors(problem: ScheduleProblem) -> Sequence[int]:
+    return [-len(successors) for successors in problem.successors]
+
+
+@dataclass(frozen=True)
+class _Runs:
+    """Runs of neighbouring steps in a chunk that have room for some units"""
+
+    starts: list[int]  # position of the first step of each run ending in the chunk
+    durations: list[int]
+    longest: list[int]  # longest duration of the runs from each one on, then 0
+    trailing: int  # position of the run reaching the end of the chunk, if any
+
+
+class _Timeline:
+    """
+    Resource usage over time as a step function: a step holds its usage from
+    its time up to the time of the next step, the last step extends indefinitely
+
+    Steps are kept in chunks, neighbouring steps never hold the same usage.
+    The highest usage per chunk lets searches skip chunks that are entirely
+    free, and the runs of steps with room, cached per chunk and free usage,
+    let them skip chunks in which no run is long enough.
+    """
+
+    chunk_size = 256
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.starts = [-(2**63)]  # time of the first step per chunk
+        self.times = [[-(2**63)]]
+        self.usage = [[0]]
+        self.highest = [0]
+        self.runs: list[dict[int, _Runs]] = [{}]
+
+    def _locate(self, time: int) -> tuple[int, int]:
+        """The chunk and position of the step holding at time"""
+        c = bisect_right(self.starts, time) - 1
+        return c, bisect_right(self.times[c], time) - 1
+
+    def _runs(self, c: int, available: int) -> _Runs:
+        """The runs of steps in a chunk using at most available units"""
+        cached = self.runs[c]
+        if available in cached:
+            return cached[available]
+        times = self.times[c]
+        starts, durations = [], []
+        first = None
+        for i, used in enumerate(self.usage[c]):
+            if used <= available:
+                if first is None:
+                    first = i
+            elif first is not None:
+                starts.append(first)
+                durations.append(times[i] - times[first])
+                first = None
+        longest = [*durations, 0]
+        for k in reversed(range(len(durations))):
+            longest[k] = max(longest[k], longest[k + 1])
+        trailing = len(times) if first is None else first
+        runs = cached[available] = _Runs(starts, durations, longest, trailing)
+        return runs
+
+    def earliest(self, start: int, length: int, units: int) -> int:
+        """The earliest time from start on at which units are free for length"""
+        times, usage, highest = self.times, self.usage, self.highest
+        available = self.capacity - units
+        c, i = self._locate(start)
+        while True:
+            # find a step within the window without room
+            end = start + length
+            while True:
+                if i == len(times[c]):
+                    c += 1
+                    if c == len(times):
+                        return start
+                    i = 0
+                if times[c][i] >= end:
+                    return start
+                if highest[c] <= available:
+                    i = len(times[c])
+                elif usage[c][i] > available:
+                    break
+                else:
+                    i += 1
+            # find the next run after it that is long enough, or that reaches
+            # the end of its chunk and may continue into the next one, which
+            # the last chunk has as its last step is never occupied
+            while True:
+                runs = self._runs(c, available)
+                k = bisect_right(runs.starts, i)
+                if runs.longest[k] >= length:
+                    while runs.durations[k] < length:
+                        k += 1
+                    return times[c][runs.starts[k]]
+                if runs.trailing < len(times[c]):
+                    break
+                c += 1
+                i = -1
+            i = runs.trailing
+            start = times[c][i]
+
+    def reserve(self, start: int, length: int, units: int) -> None:
+        end = start + length
+        self._split(start)
+        self._split(end)
+        c, i = self._locate(start)
+        times, usage = self.times, self.usage
+        while times[c][i] < end:
+            usage[c][i] += units
+            i += 1
+            if i == len(times[c]):
+                self._update(c)
+                c += 1
+                i = 0
+        self._update(c)
+        self._merge(end)
+        self._merge(start)
+
+    def _update(self, c: int) -> None:
+        self.highest[c] = max(self.usage[c])
+        self.runs[c] = {}
+
+    def _split(self, time: int) -> None:
+        """Start a new step at time, holding the same usage as before"""
+        c, i = self._locate(time)
+        times, usage = self.times[c], self.usage[c]
+        if times[i] == time:
+            return
+        times.insert(i + 1, time)
+        usage.insert(i + 1, usage[i])
+        if len(times) > 2 * self.chunk_size:
+            half = len(times) // 2
+            self.times.insert(c + 1, times[half:])
+            self.usage.insert(c + 1, usage[half:])
+            del times[half:], usage[half:]
+            self.starts.insert(c + 1, self.times[c + 1][0])
+            self.highest.insert(c + 1, 0)
+            self.runs.insert(c + 1, {})
+            self._update(c + 1)
+        self._update(c)
+
+    def _merge(self, time: int) -> None:
+        """Remove the step at time if it holds the same usage as the one before"""
+        c, i = self._locate(time)
+        times, usage = self.times[c], self.usage[c]
+        if i > 0:
+            previous = usage[i - 1]
+        elif c > 0:
+            previous = self.usage[c - 1][-1]
+        else:
+            return
+        if usage[i] != previous:
+            return
+        del times[i], usage[i]
+        if not times:
+            del self.starts[c], self.times[c], self.usage[c]
+            del self.highest[c], self.runs[c]
+        else:
+            self.starts[c] = times[0]
+            self._update(c)
+
+
+def _solve(problem: ScheduleProblem, rule: PriorityRule) -> list[int]:
+    """Serial schedule generation: place eligible blocks one by one by priority"""
+    keys = rule(problem)
+    timelines = [_Timeline(capacity) for capacity in problem.capacities]
+    successors = problem.successors
+    demands = problem.demands
+    remaining = [0] * len(problem.lengths)
+    for block_successors in successors:
+        for successor, _ in block_successors:
+            remaining[successor] += 1
+    earliest = [0] * len(problem.lengths)
+    starts = [0] * len(problem.lengths)
+    eligible = [(keys[b], b) for b, count in enumerate(remaining) if count == 0]
+    heapify(eligible)
+    while eligible:
+        _, block = heappop(eligible)
+        start = earliest[block]
+        if block_demands := demands[block]:
+            fits = False
+            while not fits:
+                fits = True
+                for resource, begin, end, units in block_demands:
+                    feasible = timelines[resource].earliest(
+                        start + begin, end - begin, units
+                    )
+                    if feasible > start + begin:
+                        start = feasible - begin
+                        fits = False
+                        break
+            for resource, begin, end, units in block_demands:
+                timelines[resource].reserve(start + begin, end - begin, units)
+        starts[block] = start
+        for successor, lag in successors[block]:
+            if start + lag > earliest[successor]:
+                earliest[successor] = start + lag
+            remaining[successor] -= 1
+            if remaining[successor] == 0:
+                heappush(eligible, (keys[successor], successor))
+    return starts
+
+
+def _topological_order(successors: list[list[tuple[int, int]]]) -> list[int]:
+    remaining = [0] * len(successors)
+    for item_successors in successors:
+        for successor, _ in item_successors:
+            remaining[successor] += 1
+    order = [i for i, count in enumerate(remaining) if count == 0]
+    for i in order:  # grows while iterating
+        for successor, _ in successors[i]:
+            remaining[successor] -= 1
+            if remaining[successor] == 0:
+                order.append(successor)
+    return order
+
+
+def _find(parents: list[int], i: int) -> int:
+    while parents[i] != i:
+        parents[i] = i = parents[parents[i]]
+    return i
+
+
+def _matching_release(
+    request: int,
+    resource: object,
+    requests: Mapping[int, object],
+    releases: Mapping[int, object],
+    successors: list[list[tuple[int, int]]],
+    positions: list[int],
+) -> int:
+    """
+    The release ending a request that is not paired explicitly, the first
+    release of its resource in topological order with as many requests as
+    releases of the resource on the paths in between
+    """
+    # requests and releases of the resource on paths from the request
+    passed: dict[int, frozenset[int]] = {request: frozenset()}
+    heap = [(positions[request], request)]
+    while heap:  # in topological order, so all paths are known when popped
+        _, u = heappop(heap)
+        u_passed = passed[u]
+        if u in releases and releases[u] == resource:
+            if sum(1 if i in requests else -1 for i in u_passed) == 0:
+                return u
+            u_passed |= {u}
+        elif u != request and u in requests and requests[u] == resource:
+            u_passed |= {u}
+        for v, _ in successors[u]:
+            if v not in passed:
+                passed[v] = u_passed
+                heappush(heap, (positions[v], v))
+            else:
+                passed[v] |= u_passed
+    raise ValueError("A request must be followed by a matching release")
+
+
+def _between(
+    request: int,
+    release: int,
+    successors: list[list[tuple[int, int]]],
+    predecessors: list[list[int]],
+    positions: list[int],
+) -> set[int]:
+    """The nodes on paths from a request to its release, including both"""
+    # nodes after the release in topological order cannot precede it
+    limit = positions[release]
+    reachable = {request}
+    stack = [request]
+    while stack:
+        for v, _ in successors[stack.pop()]:
+            if v not in reachable and positions[v] < limit:
+                reachable.add(v)
+                stack.append(v)
+    between = {release}
+    stack = [release]
+    while stack:
+        for u in predecessors[stack.pop()]:
+            if u in reachable and u not in between:
+                between.add(u)
+                stack.append(u)
+    if request not in between:
+        raise ValueError("A release must follow the request it is paired with")
+    return between
+
+
+def _close_blocks(
+    parents: list[int],
+    successors: list[list[tuple[int, int]]],
+    predecessors: list[list[int]],
+    positions: list[int],
+) -> None:
+    """
+    Add the nodes on paths between two members of a block to that block,
+    merging blocks, until no block can be left and reentered
+    """
+    changed = True
+    while changed:
+        changed = False
+        blocks: dict[int, list[int]] = {}
+        for i in range(len(parents)):
+            blocks.setdefault(_find(parents, i), []).append(i)
+        for members in blocks.values():
+            if len(members) == 1:
+                continue
+            first = min(positions[i] for i in members)
+            last = max(positions[i] for i in members)
+            after = set(members)
+            stack = members.copy()
+            while stack:
+                for v, _ in successors[stack.pop()]:
+                    if v not in after and positions[v] < last:
+                        after.add(v)
+                        stack.append(v)
+            before = set(members)
+            stack = members.copy()
+            while stack:
+                for u in predecessors[stack.pop()]:
+                    if u not in before and positions[u] > first:
+                        before.add(u)
+                        stack.append(u)
+            root = _find(parents, members[0])
+            for i in after & before:
+                other = _find(parents, i)
+                if other != root:
+                    parents[other] = root
+                    changed = True
+
+
+def _demands(
+    intervals: list[tuple[int, int, int]], capacities: list[int]
+) -> tuple[Demand, ...]:
+    """Aggregate holding intervals (resource, start, end) into disjoint steps"""
+    changes: dict[int, dict[int, int]] = {}
+    for resource, begin, end in intervals:
+        if begin < end:
+            resource_changes = changes.setdefault(resource, {})
+            resource_changes[begin] = resource_changes.get(begin, 0) + 1
+            resource_changes[end] = resource_changes.get(end, 0) - 1
+    demands = []
+    for resource, resource_changes in changes.items():
+        units = 0
+        steps = sorted(resource_changes.items())
+        for (time, change), (next_time, _) in zip(steps, steps[1:]):
+            units += change
+            if units > capacities[resource]:
+                raise ValueError(
+                    f"Holding {units} units at once exceeds the capacity "
+                    f"{capacities[resource]} of a resource"
+                )
+            if units > 0:
+                demands.append((resource, time, next_time, units))
+    return tuple(demands)
+
+
+def _compile(
+    graph: CompactGraph, capacities: Mapping[object, int]
+) -> tuple[ScheduleProblem, list[BlockId], list[int]]:
+    size = len(graph.ids)
+    successors: list[list[tuple[int, int]]] = [[] for _ in range(size)]
+    predecessors: list[list[int]] = [[] for _ in range(size)]
+    for u, v, duration in chain(
+        zip(graph.process_starts, graph.process_ends, graph.durations),
+        zip(graph.dependency_starts, graph.dependency_ends, repeat(0)),
+    ):
+        successors[u].append((v, duration))
+        predecessors[v].append(u)
+    node_order = _topological_order(successors)
+    if len(node_order) != size:
+        raise ValueError("Graph contains a cycle")
+    positions = [0] * size
+    for position, u in enumerate(node_order):
+        positions[u] = position
+
+    # nodes within overlapping holding intervals end up in the same block
+    requests, releases = graph.requests, graph.releases
+    paired = dict(graph.holdings)
+    parents = list(range(size))
+    intervals = []
+    for request, resource in requests.items():
+        if request in paired:
+            release = paired[request]
+        else:
+            release = _matching_release(
+                request, resource, requests, releases, successors, positions
+            )
+        intervals.append((resource, request, release))
+        root = _find(parents, request)
+        for i in _between(request, release, successors, predecessors, positions):
+            parents[_find(parents, i)] = root
+    _close_blocks(parents, successors, predecessors, positions)
+    roots: dict[int, BlockId] = {}
+    block_of = [roots.setdefault(_find(parents, i), len(roots)) for i in range(size)]
+
+    offsets = [0] * size
+    lengths = [0] * len(roots)
+    block_successors: list[list[tuple[BlockId, int]]] = [[] for _ in roots]
+    for u in node_order:
+        block = block_of[u]
+        offset = offsets[u]
+        if offset > lengths[block]:
+            lengths[block] = offset
+        for v, duration in successors[u]:
+            if block_of[v] == block and offset + duration > offsets[v]:
+                offsets[v] = offset + duration
+    # lags need the final offsets of both ends
+    for u, u_successors in enumerate(successors):
+        block = block_of[u]
+        for v, duration in u_successors:
+            if block_of[v] != block:
+                lag = offsets[u] + duration - offsets[v]
+                block_successors[block].append((block_of[v], lag))
+    order = _topological_order(block_successors)
+    if len(order) != len(roots):
+        raise ValueError("Holding intervals depend on each other in a cycle")
+
+    resources = {resource: i for i, resource in enumerate(capacities)}
+    block_intervals: list[list[tuple[int, int, int]]] = [[] for _ in roots]
+    for resource, request, release in intervals:
+        if resource in resources:
+            block_intervals[block_of[request]].append(
+                (resources[resource], offsets[request], offsets[release])
+            )
+    capacity_list = list(capacities.values())
+    problem = ScheduleProblem(
+        lengths=lengths,
+        successors=block_successors,
+        demands=[_demands(i, capacity_list) for i in block_intervals],
+        capacities=capacity_list,
+        order=order,
+    )
+    return problem, block_of, offsets
+
+
+def schedule(
+    graph: Graph | CompactGraph,
+    capacities: Mapping[object, int],
+    rules: Sequence[PriorityRule] = (latest_finish, longest_path, most_successors),
+    max_workers: int | None = None,
+) -> Schedule:
+    """
+    Find a feasible schedule respecting precedence and resource capacities
+
+    Every request holds one unit of its resource until the release it is paired
+    with in the holdings of the graph. Unpaired requests hold it until the
+    first following release of the resource that does not end a nested
+    request of the same resource. Resources without a capacity are not
+    constrained. Branches of choice edges are not compiled, so a choice edge
+    takes no time and uses no resources.
+
+    Each priority rule is tried, in parallel worker processes unless there is
+    only one rule or worker, and the schedule with the smallest makespan is
+    returned. Rules are sent to the workers by pickling, so lambdas and
+    closures require max_workers=1. Start times are keyed by node, or by node
+    id for a compact graph.
+    """
+    if not rules:
+        raise ValueError("At least one priority rule is required")
+    if isinstance(graph, Graph):
+        graph = CompactGraph.from_graph(graph)
+    problem, block_of, offsets = _compile(graph, capacities)
+    workers = min(len(rules), max_workers or os.cpu_count() or 1)
+    if workers == 1:
+        results = list(map(_solve, repeat(problem), rules))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_solve, repeat(problem), rules))
+    makespans = [
+        max(map(int.__add__, starts, problem.lengths), default=0) for starts in results
+    ]
+    best = makespans.index(min(makespans))
+    starts = results[best]
+    return Schedule(
+        start_times={
+            node: starts[block] + offset
+            for node, block, offset in zip(graph.ids, block_of, offsets)
+        },
+        makespan=makespans[best],
+        rule=rules[best],
+    )
@@ -0,0 +1,90 @@
+import pytest
+
+from processmap import CompactGraph
+from processmap import DependencyEdge as DE
+from processmap import Graph, GraphBuilder
+from processmap import Process as P
+from processmap import ProcessEdge as PE
+from processmap import ProcessNode
+from processmap.common import fset
+
+from .common import isomorphic_graph
+
+
+class TestGraphBuilder:
+    def test_processes_and_dependencies(self) -> None:
+        builder = GraphBuilder()
+        builder.add_processes(
+            starts=[1, 3, 5], ends=[2, 4, 6], names=["A", "B", "E"], durations=[1, 3, 5]
+        )
+        builder.add_dependencies(starts=iter([2, 4]), ends=iter([3, 5]))
+        assert isomorphic_graph(builder.build(), P("A", 1) >> P("B", 3) >> P("E", 5))
+
+    def test_start_and_end(self) -> None:
+        builder = GraphBuilder()
+        builder.add_processes(["a0", "b0"], ["a1", "b1"], ["A", "B"], [4, 9])
+        builder.add_nodes(["x"])
+        compact = builder.compact()
+        assert [compact.ids[i] for i in compact.start] == ["a0", "b0", "x"]
+        assert [compact.ids[i] for i in compact.end] == ["a1", "b1", "x"]
+        assert isomorphic_graph(
+            builder.build(),
+            Graph(
+                nodes=fset(
+                    a1 := ProcessNode(),
+                    a2 := ProcessNode(),
+                    b1 := ProcessNode(),
+                    b2 := ProcessNode(),
+                    x := ProcessNode(),
+                ),
+                edges=fset(PE(a1, a2, "A", 4), PE(b1, b2, "B", 9)),
+                start=fset(a1, b1, x),
+                end=fset(a2, b2, x),
+            ),
+        )
+
+    def test_using_resources(self) -> None:
+        ship, crew = object(), object()
+        builder = GraphBuilder()
+        builder.add_processes(["s0"], ["s1"], ["Sail"], [1], [[ship, crew]])
+        graph = builder.build()
+        expected = P("Sail", 1).using(ship, crew).to_graph()
+        start, end = ProcessNode(), ProcessNode()
+        assert isomorphic_graph(
+            graph,
+            Graph(
+                nodes=expected.nodes | {start, end},
+                edges=expected.edges
+                | {DE(start, node) for node in expected.start}
+                | {DE(node, end) for node in expected.end},
+                start=fset(start),
+                end=fset(end),
+            ),
+        )
+
+    def test_unequal_columns(self) -> None:
+        builder = GraphBuilder()
+        with pytest.raises(ValueError):
+            builder.add_processes(["x", "y"], ["z"], ["A", "B"], [1, 1])
+        with pytest.raises(ValueError):
+            builder.add_processes(["x"], ["z"], ["A"], [1], [["quay"], ["crew"]])
+        with pytest.raises(ValueError):
+            builder.add_dependencies(["x", "y"], ["z"])
+        compact = builder.compact()
+        assert compact.ids == [] and compact.start == []
+
+    def test_from_graph(self) -> None:
+        ship, crew = object(), object()
+        graph = (P("Load", 1) >> P("Sail", 2).using(ship, crew)).to_graph()
+        compact = CompactGraph.from_graph(graph)
+        assert sorted(compact.names) == ["Load", "Sail"]
+        assert len(compact.holdings) == 2
+        assert {compact: graph}[compact] is graph  # compared by identity
+        assert isomorphic_graph(compact.to_graph(), graph)
+
+    def test_cycle(self) -> None:
+        builder = GraphBuilder()
+        builder.add_processes([1], [2], ["A"], [1])
+        builder.add_dependencies([2], [1])
+        with pytest.raises(ValueError):
+            builder.compact()
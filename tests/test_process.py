@@ -1,10 +1,24 @@
+import copy
+import gc
+import pickle
+import weakref
+from dataclasses import dataclass, field
+
 from processmap import DependencyEdge as DE
 from processmap import Graph
 from processmap import Process as P
 from processmap import ProcessEdge as PE
 from processmap import ProcessNode, Release, Request, Seq, Union
 from processmap.common import fset
-from processmap.graph import ReleaseNode, RequestNode
+from processmap.graph import ChoiceEdge, ReleaseNode, RequestNode
+from processmap.process import (
+    Option,
+    ProcessMap,
+    Subgraphs,
+    Switch,
+    dumps,
+    loads,
+)
 
 from .common import isomorphic_graph
 
@@ -310,6 +324,179 @@ class TestUsing:
         )
         assert isomorphic_graph(sail_ship, expected)
 
+    def test_same_resource_twice(self) -> None:
+        ship = object()
+        graph = (P("Load", 1).using(ship) | P("Sail", 2).using(ship)).to_graph()
+        assert len(graph.nodes) == 8
+        assert len(graph.start) == 2
+
+
+@dataclass(frozen=True)
+class Counted(ProcessMap):
+    process: ProcessMap
+    compiled: list[ProcessMap] = field(default_factory=list, compare=False)
+
+    def _to_subgraph(self, subgraphs: Subgraphs) -> Graph:
+        self.compiled.append(self.process)
+        return self.process.to_subgraph(subgraphs)
+
+
+def _choice_edge(graph: Graph) -> ChoiceEdge:
+    (edge,) = (edge for edge in graph.edges if isinstance(edge, ChoiceEdge))
+    return edge
+
+
+class TestOption:
+    def test_to_graph(self) -> None:
+        graph = Option(lambda: True, P("Inspect", 1)).to_graph()
+        edge = _choice_edge(graph)
+        assert graph.nodes == {edge.start, edge.end}
+        assert graph.edges == {edge}
+        assert (graph.start, graph.end) == (fset(edge.start), fset(edge.end))
+
+    def test_not_compiled_until_chosen(self) -> None:
+        inspect = Counted(P("Inspect", 1))
+        graph = (P("Unload", 1) >> Option(lambda: False, inspect)).to_graph()
+        assert _choice_edge(graph).choose() is None
+        assert inspect.compiled == []
+
+    def test_compiled_once(self) -> None:
+        inspect = Counted(P("Inspect", 1))
+        edge = _choice_edge(Option(lambda: True, inspect).to_graph())
+        first = edge.choose()
+        assert first is not None and isomorphic_graph(first, P("Inspect", 1))
+        assert edge.choose() is first
+        assert len(inspect.compiled) == 1
+
+    def test_shared_process_keeps_nodes(self) -> None:
+        store = P("Store", 1)
+        graph = (P("Unload", 1) >> store | Option(lambda: True, store)).to_graph()
+        branch = _choice_edge(graph).choose()
+        assert branch is not None and isomorphic_graph(branch, store)
+        assert branch.nodes <= graph.nodes
+        assert branch.edges <= graph.edges
+
+    def test_root_dropped_before_chosen(self) -> None:
+        # compiled process maps must outlive the root, or new process maps
+        # compiled by choose(), like the requests of using(), may reuse their ids
+        root = P("Unload", 1).using("ship") >> Option(
+            lambda: True, P("Inspect", 1).using("crew")
+        )
+        edge = _choice_edge(root.to_graph())
+        dropped = weakref.ref(root)
+        del root
+        gc.collect()
+        assert dropped() is not None
+        branch = edge.choose()
+        assert branch is not None
+        assert isomorphic_graph(branch, P("Inspect", 1).using("crew"))
+
+
+class TestSwitch:
+    def test_only_chosen_branch_compiled(self) -> None:
+        passed = Counted(P("Store", 1))
+        failed = Counted(P("Rework", 3) >> P("Store", 1))
+        outcomes = iter([True, True, False])
+        switch = Switch(lambda: next(outcomes), passed, failed)
+        edge = _choice_edge(switch.to_graph())
+        assert passed.compiled == [] and failed.compiled == []
+        first = edge.choose()
+        assert first is not None and isomorphic_graph(first, P("Store", 1))
+        assert edge.choose() is first
+        assert failed.compiled == []
+        second = edge.choose()
+        assert second is not None
+        assert isomorphic_graph(second, P("Rework", 3) >> P("Store", 1))
+        assert len(passed.compiled) == 1 and len(failed.compiled) == 1
+
+
+def _always() -> bool:
+    return True
+
+
+def _durations(chain: ProcessMap) -> list[int]:
+    """Durations of the steps of a long chain, without recursion"""
+    durations = []
+    while isinstance(chain, Seq):
+        assert isinstance(chain.b, P)
+        durations.append(chain.b.duration)
+        chain = chain.a
+    return durations
+
+
+class TestPickle:
+    def test_round_trip(self) -> None:
+        ship = "ship"
+        maps = [
+            P("A", 1) >> P("B", 2),
+            P("A", 1) | P("B", 2),
+            Request(ship) >> Release(ship),
+            P("Sail", 1).using(ship, "crew"),
+            Option(_always, P("Inspect", 1)),
+            Switch(_always, P("Store", 1), P("Rework", 3)),
+        ]
+        for process_map in maps:
+            assert pickle.loads(pickle.dumps(process_map)) == process_map
+
+    def test_long_chain(self) -> None:
+        chain: ProcessMap = P("Start", 0)
+        for i in range(10_000):
+            chain = chain >> P("Step", i)
+        result = pickle.loads(pickle.dumps(chain))
+        assert _durations(result) == list(reversed(range(10_000)))
+
+    def test_sharing_preserved(self) -> None:
+        b = P("B", 1)
+        x = (P("A", 1) >> b >> P("C", 1)) | (P("D", 1) >> b).using("quay")
+        result = pickle.loads(pickle.dumps(x))
+        assert isinstance(result, Union)
+        assert result.a.a.b is result.b.process.b  # type: ignore[attr-defined]
+        assert isomorphic_graph(result, x)
+
+    def test_shallow_copy(self) -> None:
+        chain = P("A", 1) >> P("B", 1) >> P("C", 1)
+        result = copy.copy(chain)
+        assert result == chain and result is not chain
+        assert result.a is chain.a and result.b is chain.b
+
+    def test_deep_copy(self) -> None:
+        b = P("B", 1)
+        x = (P("A", 1) >> b) | (b >> P("C", 1))
+        result = copy.deepcopy(x)
+        assert isinstance(result, Union) and result == x
+        assert result.a.b is result.b.a  # type: ignore[attr-defined]
+        assert result.a.b is not b  # type: ignore[attr-defined]
+
+    def test_other_process_maps(self) -> None:
+        x = Counted(P("A", 1)) >> P("B", 1)
+        assert pickle.loads(pickle.dumps(x)) == x
+
+    def test_dumps_shares_between_roots(self) -> None:
+        x = P("A", 1) >> P("B", 1)
+        first, second = loads(dumps([x, x.b]))
+        assert first == x and first.b is second
+        steps: ProcessMap = P("Start", 0)
+        for i in range(2000):
+            steps = steps >> P("Step", i)
+        maps = [P("Arrive", i) >> steps for i in range(50)]
+        assert len(dumps(maps)) < 2 * len(dumps(steps))
+        result = loads(dumps(maps))
+        assert [x.a for x in result] == [x.a for x in maps]
+        assert all(x.b is result[0].b for x in result)
+        assert _durations(result[0].b) == list(reversed(range(2000)))
+
+    def test_dumps_shares_through_other_process_maps(self) -> None:
+        b = P("B", 1)
+        result = loads(dumps(Counted(b) >> b))
+        assert result == Counted(b) >> b
+        assert result.a.process is result.b
+
+    def test_dumps_long_chain(self) -> None:
+        chain: ProcessMap = P("Start", 0)
+        for i in range(10_000):
+            chain = chain >> P("Step", i)
+        assert _durations(loads(dumps(chain))) == list(reversed(range(10_000)))
+
 
 # def test_process_with_resource() -> None:
 #     quay = Resource()
@@ -0,0 +1,240 @@
+import os
+import random
+from collections.abc import Hashable, Mapping, Sequence
+from dataclasses import replace
+
+import pytest
+
+from processmap import CompactGraph, Graph, GraphBuilder
+from processmap import Process as P
+from processmap import (
+    ProcessEdge,
+    ProcessNode,
+    Request,
+    ScheduleProblem,
+    latest_finish,
+    longest_path,
+    most_successors,
+    schedule,
+)
+from processmap.common import fset
+
+
+def _shortest_path(problem: ScheduleProblem) -> Sequence[int]:
+    return [-key for key in longest_path(problem)]
+
+
+def _peak_usage(graph: Graph, start_times: Mapping[Hashable, int]) -> int:
+    changes: dict[int, int] = {}
+    for request, release in graph.holdings:
+        begin, end = start_times[request], start_times[release]
+        changes[begin] = changes.get(begin, 0) + 1
+        changes[end] = changes.get(end, 0) - 1
+    usage = peak = 0
+    for _, change in sorted(changes.items()):
+        usage += change
+        peak = max(peak, usage)
+    return peak
+
+
+def _times(graph: Graph, start_times: Mapping[Hashable, int]) -> list[tuple[str, int]]:
+    return sorted(
+        (edge.name, start_times[edge.start])
+        for edge in graph.edges
+        if isinstance(edge, ProcessEdge)
+    )
+
+
+class TestSchedule:
+    def test_empty(self) -> None:
+        graph = Graph(nodes=fset(), edges=fset(), start=fset(), end=fset())
+        result = schedule(graph, {}, max_workers=1)
+        assert result.start_times == {}
+        assert result.makespan == 0
+
+    def test_precedence(self) -> None:
+        graph = (P("A", 2) >> P("B", 3) | P("C", 4)).to_graph()
+        result = schedule(graph, {}, max_workers=1)
+        assert _times(graph, result.start_times) == [("A", 0), ("B", 2), ("C", 0)]
+        assert result.makespan == 5
+
+    def test_shared_resource_is_not_overbooked(self) -> None:
+        quay = object()
+        graph = (
+            P("Dock 1", 2).using(quay)
+            | P("Dock 2", 3).using(quay)
+            | P("Dock 3", 1).using(quay)
+        ).to_graph()
+        result = schedule(graph, {quay: 1}, max_workers=1)
+        durations = {"Dock 1": 2, "Dock 2": 3, "Dock 3": 1}
+        docked = sorted(
+            (start, start + durations[name])
+            for name, start in _times(graph, result.start_times)
+        )
+        assert all(end <= start for (_, end), (start, _) in zip(docked, docked[1:]))
+        assert result.makespan == 6
+
+    def test_capacity_allows_parallel_holding(self) -> None:
+        quay = object()
+        graph = (P("Dock 1", 2).using(quay) | P("Dock 2", 3).using(quay)).to_graph()
+        result = schedule(graph, {quay: 2}, max_workers=1)
+        assert _times(graph, result.start_times) == [("Dock 1", 0), ("Dock 2", 0)]
+
+    def test_unconstrained_resource(self) -> None:
+        graph = (P("A", 2).using(quay := object()) | P("B", 2).using(quay)).to_graph()
+        assert schedule(graph, {}, max_workers=1).makespan == 2
+
+    def test_holding_spans_nested_processes(self) -> None:
+        ship, crew = object(), object()
+        graph = (
+            (P("Load", 1) >> P("Sail", 2).using(crew)).using(ship)
+            | P("Train", 4).using(crew)
+        ).to_graph()
+        result = schedule(graph, {ship: 1, crew: 1}, max_workers=1)
+        times = dict(_times(graph, result.start_times))
+        sail, train = times["Sail"], times["Train"]
+        assert sail + 2 <= train or train + 4 <= sail
+        assert times["Load"] + 1 <= sail
+
+    def test_reuse_after_holding_several_resources(self) -> None:
+        graph = (
+            P("Sail", 3).using("ship", "crew") >> P("Unload", 2).using("ship")
+        ).to_graph()
+        result = schedule(graph, {"ship": 1, "crew": 1}, max_workers=1)
+        assert _times(graph, result.start_times) == [("Sail", 0), ("Unload", 3)]
+        assert result.makespan == 5
+
+    def test_nested_holding_of_same_resource(self) -> None:
+        graph = (
+            (P("A", 1).using("r") >> P("B", 5)).using("r")
+            | P("C", 5).using("r")
+            | P("D", 5).using("r")
+        ).to_graph()
+        # unpaired requests are matched by walking the graph
+        for variant in (graph, replace(graph, holdings=frozenset())):
+            result = schedule(variant, {"r": 2}, max_workers=1)
+            assert _peak_usage(graph, result.start_times) <= 2
+            assert result.makespan == 11
+
+    def test_path_between_holdings_joins_block(self) -> None:
+        u, v, w, x = P("U", 1), P("V", 1), P("W", 1), P("X", 1)
+        graph = ((u >> x).using("a") | (x >> v).using("b") | (u >> w >> v)).to_graph()
+        result = schedule(graph, {"a": 1, "b": 1}, max_workers=1)
+        times = dict(_times(graph, result.start_times))
+        assert times["U"] + 1 <= times["W"] and times["W"] + 1 <= times["V"]
+        assert result.makespan == 3
+
+    def test_best_rule_is_returned(self) -> None:
+        quay = object()
+        graph = (
+            P("Short", 1).using(quay) | P("Long", 1).using(quay) >> P("Sail", 10)
+        ).to_graph()
+        worst = schedule(graph, {quay: 1}, rules=[_shortest_path], max_workers=1)
+        assert worst.makespan == 12
+        rules = (_shortest_path, longest_path)
+        result = schedule(graph, {quay: 1}, rules=rules, max_workers=1)
+        assert result.makespan == 11
+        assert result.rule is longest_path
+
+    def test_builtin_rules(self) -> None:
+        quay = object()
+        graph = (
+            P("Short", 1).using(quay) | P("Long", 1).using(quay) >> P("Sail", 10)
+        ).to_graph()
+        for rule in (latest_finish, longest_path, most_successors):
+            assert schedule(graph, {quay: 1}, rules=[rule]).makespan == 11
+
+    def test_parallel_rules(self) -> None:
+        quay = object()
+        graph = (P("A", 2).using(quay) | P("B", 2).using(quay) >> P("C", 1)).to_graph()
+        result = schedule(graph, {quay: 1}, max_workers=2)
+        assert result.makespan == 4
+
+    def test_unmatched_request(self) -> None:
+        graph = (Request(object()) >> P("A", 1)).to_graph()
+        with pytest.raises(ValueError):
+            schedule(graph, {}, max_workers=1)
+
+    def test_insufficient_capacity(self) -> None:
+        graph = P("A", 1).using(quay := object()).to_graph()
+        with pytest.raises(ValueError):
+            schedule(graph, {quay: 0}, max_workers=1)
+
+    def test_nodes_without_edges(self) -> None:
+        graph = Graph(
+            nodes=fset(node := ProcessNode()),
+            edges=fset(),
+            start=fset(node),
+            end=fset(node),
+        )
+        assert schedule(graph, {}, max_workers=1).start_times == {node: 0}
+
+    def test_compact_graph_by_id(self) -> None:
+        builder = GraphBuilder()
+        builder.add_processes(
+            ["a0", "b0"], ["a1", "b1"], ["A", "B"], [2, 3], [["quay"], ["quay"]]
+        )
+        builder.add_dependencies(["a1"], ["b0"])
+        result = schedule(builder.compact(), {"quay": 1}, max_workers=1)
+        assert result.start_times["a0"] == 0
+        assert result.start_times["b0"] == 2
+        assert result.start_times["b1"] == 5
+
+    def test_lag_uses_final_offsets(self) -> None:
+        # a is indexed before the request, so b -> xe is seen before xs -> xe
+        graph = CompactGraph(
+            ids=["a", "b", "request", "xs", "xe", "release"],
+            requests={2: "quay"},
+            releases={5: "quay"},
+            process_starts=[0, 3],
+            process_ends=[1, 4],
+            names=["U", "X"],
+            durations=[1, 5],
+            dependency_starts=[2, 1, 4],
+            dependency_ends=[3, 4, 5],
+            start=[0, 2],
+            end=[5],
+        )
+        result = schedule(graph, {}, max_workers=1)
+        assert result.makespan == 5
+        assert result.start_times["request"] == 0
+
+    def test_unpicklable_rule_in_process(self) -> None:
+        graph = (P("A", 2) | P("B", 3)).to_graph()
+        result = schedule(graph, {}, rules=[lambda problem: [0] * 4], max_workers=1)
+        assert result.makespan == 3
+
+    def test_single_cpu_in_process(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(os, "cpu_count", lambda: 1)
+        graph = (P("A", 2) | P("B", 3)).to_graph()
+        rules = [lambda problem: [0] * 4, lambda problem: [1] * 4]
+        assert schedule(graph, {}, rules=rules).makespan == 3
+
+
+@pytest.mark.parametrize("resources, capacity", [(1, 1), (10, 3)])
+def test_many_activities(resources: int, capacity: int) -> None:
+    random.seed(0)
+    size = 20_000
+    names = [f"R{i}" for i in range(resources)]
+    used = [[random.choice(names)] for _ in range(size)]
+    durations = [random.randint(1, 10) for _ in range(size)]
+    builder = GraphBuilder()
+    builder.add_processes(
+        range(0, 2 * size, 2), range(1, 2 * size, 2), ["A"] * size, durations, used
+    )
+    result = schedule(
+        builder.compact(),
+        dict.fromkeys(names, capacity),
+        rules=[latest_finish],
+        max_workers=1,
+    )
+    changes: dict[str, dict[int, int]] = {name: {} for name in names}
+    for i, ([name], duration) in enumerate(zip(used, durations)):
+        start = result.start_times[2 * i + 1] - duration
+        changes[name][start] = changes[name].get(start, 0) + 1
+        changes[name][start + duration] = changes[name].get(start + duration, 0) - 1
+    for resource_changes in changes.values():
+        usage = 0
+        for _, change in sorted(resource_changes.items()):
+            usage += change
+            assert usage <= capacity